@@ -1,34 +1,118 @@
-import json
+import hashlib
+import hmac
 import logging
 import os
-from typing import cast
-from urllib import request
+import time
+from collections.abc import Mapping
+from pathlib import Path
+from urllib.parse import urlsplit
 
-from dotenv import load_dotenv
+import orjson
+import requests
 from neon_api import NeonAPI
 from neon_api.schema import Project
+from pydantic import TypeAdapter
+from requests.adapters import HTTPAdapter
+from urllib3.util import Retry
 
 from models import (
     PLAN_CATALOG,
+    PLAN_TUPLES,
     AlertMode,
     AlertThresholds,
     CostBreakdown,
-    PlanName,
+    PlanPrices,
     UsageTotals,
     WebHookProvider,
 )
 
 
+def _resolve_log_level(raw_value: str | None) -> int:
+    # unknown names (or numbers) fall back to INFO instead of failing at import
+    level_name = (raw_value or "").strip().upper()
+    return logging.getLevelNamesMapping().get(level_name, logging.INFO)
+
+
 logging.basicConfig(
-    level=logging.INFO,
+    level=_resolve_log_level(os.getenv("LOG_LEVEL")),
     format="%(asctime)s [%(levelname)s] %(message)s",
 )
 logger = logging.getLogger("neon_billing_alerts")
 
+# (connect, read) timeouts for webhook delivery
+WEBHOOK_TIMEOUT_SECONDS = (3.0, 10.0)
+USER_AGENT = "neon-billing-alerts-action/1.0.0"
+DEFAULT_CACHE_TTL_SECONDS = 300.0
+
+REQUIRED_ENV_VARS = ("NEON_API_KEY", "NEON_PROJECT_ID", "WEBHOOK_URL")
+# AlertThresholds field -> environment variable
+THRESHOLD_ENV_VARS = {
+    "max_spend_usd": "MAX_SPEND_USD",
+    "max_cu_usage": "MAX_CU_USAGE",
+    "max_storage_gb_month": "MAX_STORAGE_GB_MONTH",
+    "max_egress_gb": "MAX_EGRESS_GB",
+}
+
+_MARKDOWN_TEMPLATE = """{header}
+- Trigger: {trigger_line}
+```
+| Usage        |  Amount  |   Cost   |
+|--------------|----------|----------|
+| Compute CU-h | {compute_amount:8.2f} | ${compute_cost:7.2f} |
+| Storage GB-m | {storage_amount:8.2f} | ${storage_cost:7.2f} |
+| Egress GB    | {egress_amount:8.2f} | ${egress_cost:7.2f} |
+| Total        |    —     | ${total_cost:7.2f} |
+```"""
+
+# Indexed by WebHookProvider. Per-POST limits: items per message,
+# characters per item, and characters across all items (Discord caps the
+# combined embed text at 6000; Slack has no overall cap beyond the block count).
+_PAYLOAD_KEYS = ("text", "content")
+_BATCH_LIMITS = (50, 10)
+_ITEM_TEXT_LIMITS = (3000, 4096)
+_PAYLOAD_TEXT_LIMITS = (50 * 3000, 6000)
+_HEADER_FORMATS = ("*Neon billing alert — {}*", "**Neon billing alert — {}**")
+
+_ALERT_MODES = {"always": AlertMode.ALWAYS, "thresholds": AlertMode.THRESHOLDS}
+
+_HOST_TO_PROVIDER: dict[str, WebHookProvider] = {
+    "hooks.slack.com": WebHookProvider.SLACK,
+    "discord.com": WebHookProvider.DISCORD,
+    "discordapp.com": WebHookProvider.DISCORD,
+    "canary.discord.com": WebHookProvider.DISCORD,
+    "ptb.discord.com": WebHookProvider.DISCORD,
+}
+
+_PROJECT_ADAPTER = TypeAdapter(Project)
+
+# Shared across the run so connections (and TLS sessions) are reused,
+# retrying rate limits and transient server errors with backoff.
+_SESSION = requests.Session()
+_ADAPTER = HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=8,
+    max_retries=Retry(
+        total=5,
+        backoff_factor=0.5,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=frozenset(["POST"]),
+        respect_retry_after_header=True,
+    ),
+)
+_SESSION.mount("https://", _ADAPTER)
+_SESSION.mount("http://", _ADAPTER)
+
+
+def _require_env(env: Mapping[str, str], name: str) -> str:
+    value = env.get(name, "").strip()
+    if not value:
+        raise ValueError(f"Environment variable {name} is required.")
+    return value
 
-def _parse_threshold(name: str) -> float | None:
-    raw_value = os.getenv(name)
-    if raw_value is None or raw_value.strip() == "":
+
+def _parse_optional_float(env: Mapping[str, str], name: str) -> float | None:
+    raw_value = env.get(name, "")
+    if raw_value.strip() == "":
         return None
     try:
         return float(raw_value.strip())
@@ -36,6 +120,49 @@ def _parse_threshold(name: str) -> float | None:
         raise ValueError(f"{name} must be a number, got {raw_value!r}") from error
 
 
+def _parse_thresholds(env: Mapping[str, str]) -> AlertThresholds:
+    return AlertThresholds(
+        **{
+            field: _parse_optional_float(env, name)
+            for field, name in THRESHOLD_ENV_VARS.items()
+        }
+    )
+
+
+def _cache_path(cache_dir: Path, project_id: str) -> Path:
+    if "/" in project_id or (os.altsep and os.altsep in project_id):
+        raise ValueError(f"Invalid project ID for cache path: {project_id!r}")
+    return cache_dir / f"{project_id}.json"
+
+
+def _load_or_fetch_project(
+    neon_api: NeonAPI,
+    project_id: str,
+    ttl_seconds: float,
+    cache_dir: Path,
+) -> Project:
+    cache_path = _cache_path(cache_dir, project_id)
+    try:
+        age_seconds = time.time() - cache_path.stat().st_mtime
+        if age_seconds < ttl_seconds:
+            project = _PROJECT_ADAPTER.validate_json(cache_path.read_bytes())
+            logger.info("Using cached project (%.0fs old)", age_seconds)
+            return project
+    except (OSError, ValueError):
+        # missing, unreadable or stale-schema cache falls through to a fetch
+        pass
+
+    project = neon_api.project(project_id).project
+    try:
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = cache_path.with_suffix(".json.tmp")
+        tmp_path.write_bytes(_PROJECT_ADAPTER.dump_json(project))
+        os.replace(tmp_path, cache_path)
+    except OSError as error:
+        logger.warning("Could not write project cache: %s", error)
+    return project
+
+
 def _compute_usage(project: Project) -> UsageTotals:
     compute_cu_hours = project.compute_time_seconds / 3600.0
     storage_gb_month = (project.data_storage_bytes_hour / (1024.0**3)) / 730.0
@@ -47,17 +174,24 @@ def _compute_usage(project: Project) -> UsageTotals:
     )
 
 
-def _compute_costs(plan: PlanName, usage: UsageTotals) -> CostBreakdown:
-    pricing = PLAN_CATALOG[plan]
+def _compute_costs(prices: PlanPrices, usage: UsageTotals) -> CostBreakdown:
+    (
+        compute_price,
+        storage_price,
+        egress_price,
+        free_compute,
+        free_storage,
+        free_egress,
+    ) = prices
     # if usage is less than amount of free usage, don't bill
-    billable_compute = max(0.0, usage.compute_cu_hours - pricing.free_compute_cu_hour)
-    billable_storage = max(0.0, usage.storage_gb_month - pricing.free_storage_gb_month)
-    billable_egress = max(0.0, usage.egress_gb - pricing.free_egress_gb)
+    billable_compute = usage.compute_cu_hours - free_compute
+    billable_storage = usage.storage_gb_month - free_storage
+    billable_egress = usage.egress_gb - free_egress
 
     return CostBreakdown(
-        compute_cost=billable_compute * pricing.compute_cu_hour,
-        storage_cost=billable_storage * pricing.storage_gb_month,
-        egress_cost=billable_egress * pricing.egress_gb,
+        compute_cost=billable_compute * compute_price if billable_compute > 0 else 0.0,
+        storage_cost=billable_storage * storage_price if billable_storage > 0 else 0.0,
+        egress_cost=billable_egress * egress_price if billable_egress > 0 else 0.0,
     )
 
 
@@ -65,28 +199,26 @@ def _evaluate_alerts(
     mode: AlertMode,
     thresholds: AlertThresholds,
     usage: UsageTotals,
-    costs: CostBreakdown,
+    total_cost: float | None,
 ) -> list[str]:
-    if mode == "always":
+    if mode is AlertMode.ALWAYS:
         return ["alert_mode=always"]
 
-    if (
-        thresholds.max_spend_usd is None
-        and thresholds.max_cu_usage is None
-        and thresholds.max_storage_gb_month is None
-        and thresholds.max_egress_gb is None
-    ):
+    if not thresholds.any_set:
         raise ValueError(
             "alert_mode=thresholds requires at least one threshold input.",
         )
 
+    if thresholds.max_spend_usd is not None and total_cost is None:
+        raise ValueError("max_spend_usd threshold requires the total cost.")
+
     triggers: list[str] = []
-    total_cost_value = costs.compute_cost + costs.storage_cost + costs.egress_cost
 
     # Cost threshold
     if (
         thresholds.max_spend_usd is not None
-        and total_cost_value >= thresholds.max_spend_usd
+        and total_cost is not None
+        and total_cost >= thresholds.max_spend_usd
     ):
         triggers.append(f"total_cost>={thresholds.max_spend_usd}")
 
@@ -114,26 +246,100 @@ def _evaluate_alerts(
     return triggers
 
 
+def _detect_provider(webhook_url: str) -> WebHookProvider:
+    provider = _HOST_TO_PROVIDER.get(urlsplit(webhook_url).hostname or "")
+    if provider is None:
+        raise ValueError(f"Unsupported webhook URL: {webhook_url}")
+    return provider
+
+
+def _post_payload(
+    webhook_url: str,
+    payload: dict[str, object],
+    signing_secret: bytes | None = None,
+) -> None:
+    body = orjson.dumps(payload)
+    headers = {
+        "Content-Type": "application/json",
+        "User-Agent": USER_AGENT,
+    }
+    if signing_secret is not None:
+        digest = hmac.new(signing_secret, body, hashlib.sha256).hexdigest()
+        headers["X-Webhook-Signature"] = f"sha256={digest}"
+
+    try:
+        response = _SESSION.post(
+            webhook_url,
+            data=body,
+            timeout=WEBHOOK_TIMEOUT_SECONDS,
+            headers=headers,
+        )
+    except requests.RequestException as error:
+        raise ValueError(f"Webhook delivery failed: {error}") from error
+
+    if not 200 <= response.status_code < 300:
+        raise ValueError(
+            f"Webhook delivery failed with status {response.status_code}."
+        )
+    logger.info("Webhook delivered (status %s)", response.status_code)
+
+
 def _send_webhook(
     webhook_url: str,
     provider: WebHookProvider,
     message: str,
+    signing_secret: bytes | None = None,
 ) -> None:
-    payload = {"text": message} if provider == "slack" else {"content": message}
-
-    http_request = request.Request(
-        webhook_url,
-        data=json.dumps(payload).encode("utf-8"),
-        headers={
-            "Content-Type": "application/json",
-            "User-Agent": "neon-billing-alerts-action/1.0.0",
-        },
-    )
-
-    with request.urlopen(http_request) as response:
-        if response.status >= 300:
-            raise ValueError(f"Webhook delivery failed with status {response.status}.")
-        logger.info("Webhook delivered (status %s)", response.status)
+    _post_payload(webhook_url, {_PAYLOAD_KEYS[provider]: message}, signing_secret)
+
+
+def _chunk_messages(
+    messages: list[str],
+    max_items: int,
+    max_chars: int,
+) -> list[list[str]]:
+    chunks: list[list[str]] = []
+    chunk: list[str] = []
+    chunk_chars = 0
+    for message in messages:
+        if chunk and (
+            len(chunk) == max_items or chunk_chars + len(message) > max_chars
+        ):
+            chunks.append(chunk)
+            chunk = []
+            chunk_chars = 0
+        chunk.append(message)
+        chunk_chars += len(message)
+    if chunk:
+        chunks.append(chunk)
+    return chunks
+
+
+def _send_webhook_batch(
+    webhook_url: str,
+    provider: WebHookProvider,
+    messages: list[str],
+    signing_secret: bytes | None = None,
+) -> None:
+    # an over-long item gets the whole POST rejected, so truncate it instead
+    text_limit = _ITEM_TEXT_LIMITS[provider]
+    items = [
+        message if len(message) <= text_limit else message[: text_limit - 1] + "…"
+        for message in messages
+    ]
+    for chunk in _chunk_messages(
+        items, _BATCH_LIMITS[provider], _PAYLOAD_TEXT_LIMITS[provider]
+    ):
+        if provider is WebHookProvider.SLACK:
+            payload: dict[str, object] = {
+                "blocks": [
+                    {"type": "section", "text": {"type": "mrkdwn", "text": message}}
+                    for message in chunk
+                ]
+            }
+        else:
+            payload = {"embeds": [{"description": message} for message in chunk]}
+        _post_payload(webhook_url, payload, signing_secret)
 
 
 def _render_markdown(
@@ -143,74 +349,42 @@ def _render_markdown(
     triggers: list[str],
     project_id: str,
 ) -> str:
-    total_cost_value = costs.compute_cost + costs.storage_cost + costs.egress_cost
-    trigger_line = ", ".join(triggers) if triggers else "thresholds unmet"
-    amount_compute = f"{usage.compute_cu_hours:8.2f}"
-    amount_storage = f"{usage.storage_gb_month:8.2f}"
-    amount_egress = f"{usage.egress_gb:8.2f}"
-    cost_compute = f"${costs.compute_cost:7.2f}"
-    cost_storage = f"${costs.storage_cost:7.2f}"
-    cost_egress = f"${costs.egress_cost:7.2f}"
-    cost_total = f"${total_cost_value:7.2f}"
-    header = (
-        f"**Neon billing alert — {project_id}**"
-        if provider == "discord"
-        else f"*Neon billing alert — {project_id}*"
-    )
-    return (
-        f"{header}\n"
-        f"- Trigger: {trigger_line}\n"
-        "```\n"
-        "| Usage        |  Amount  |   Cost   |\n"
-        "|--------------|----------|----------|\n"
-        f"| Compute CU-h | {amount_compute} | {cost_compute} |\n"
-        f"| Storage GB-m | {amount_storage} | {cost_storage} |\n"
-        f"| Egress GB    | {amount_egress} | {cost_egress} |\n"
-        f"| Total        |    —     | {cost_total} |\n"
-        "```"
+    return _MARKDOWN_TEMPLATE.format_map(
+        {
+            "header": _HEADER_FORMATS[provider].format(project_id),
+            "trigger_line": ", ".join(triggers) if triggers else "thresholds unmet",
+            "compute_amount": usage.compute_cu_hours,
+            "storage_amount": usage.storage_gb_month,
+            "egress_amount": usage.egress_gb,
+            "compute_cost": costs.compute_cost,
+            "storage_cost": costs.storage_cost,
+            "egress_cost": costs.egress_cost,
+            "total_cost": costs.total,
+        }
     )
 
 
 def main() -> None:
-    load_dotenv()
-
-    neon_api_key_raw = os.getenv("NEON_API_KEY")
-    if neon_api_key_raw is None or neon_api_key_raw.strip() == "":
-        raise ValueError("Environment variable NEON_API_KEY is required.")
-    neon_api_key = neon_api_key_raw.strip()
-
-    project_id_raw = os.getenv("NEON_PROJECT_ID")
-    if project_id_raw is None or project_id_raw.strip() == "":
-        raise ValueError("Environment variable NEON_PROJECT_ID is required.")
-    project_id = project_id_raw.strip()
-
-    webhook_url_raw = os.getenv("WEBHOOK_URL")
-    if webhook_url_raw is None or webhook_url_raw.strip() == "":
-        raise ValueError("Environment variable WEBHOOK_URL is required.")
-    webhook_url = webhook_url_raw.strip()
-
-    alert_mode_env = os.getenv("ALERT_MODE", "always")
-    alert_mode_value = alert_mode_env.strip().lower()
-    if alert_mode_value not in ("always", "thresholds"):
+    # the runner provides env vars directly; .env is only for local runs
+    if os.getenv("GITHUB_ACTIONS") != "true":
+        from dotenv import load_dotenv
+
+        load_dotenv()
+    env = os.environ
+
+    neon_api_key, project_id, webhook_url = (
+        _require_env(env, name) for name in REQUIRED_ENV_VARS
+    )
+
+    alert_mode_value = env.get("ALERT_MODE", "always").strip().lower()
+    alert_mode = _ALERT_MODES.get(alert_mode_value)
+    if alert_mode is None:
         raise ValueError("ALERT_MODE must be 'always' or 'thresholds'.")
     logger.info("Alert mode: %s", alert_mode_value)
 
-    thresholds = AlertThresholds(
-        max_spend_usd=_parse_threshold("MAX_SPEND_USD"),
-        max_cu_usage=_parse_threshold("MAX_CU_USAGE"),
-        max_storage_gb_month=_parse_threshold("MAX_STORAGE_GB_MONTH"),
-        max_egress_gb=_parse_threshold("MAX_EGRESS_GB"),
-    )
+    thresholds = _parse_thresholds(env)
 
-    if alert_mode_value == "always" and any(
-        threshold is not None
-        for threshold in (
-            thresholds.max_spend_usd,
-            thresholds.max_cu_usage,
-            thresholds.max_storage_gb_month,
-            thresholds.max_egress_gb,
-        )
-    ):
+    if alert_mode is AlertMode.ALWAYS and thresholds.any_set:
         raise ValueError("alert_mode=always cannot be combined with thresholds.")
     logger.info(
         "Thresholds - spend: %s, cu: %s, storage: %s, egress: %s",
@@ -221,30 +395,50 @@ def main() -> None:
     )
 
     neon_api = NeonAPI(api_key=neon_api_key)
-    project = neon_api.project(project_id).project
+    # only cache inside the runner's private temp dir, never a shared /tmp
+    runner_temp = env.get("RUNNER_TEMP", "").strip()
+    if env.get("NEON_CACHE_DISABLE", "").strip() == "1" or not runner_temp:
+        project = neon_api.project(project_id).project
+    else:
+        cache_ttl = _parse_optional_float(env, "NEON_CACHE_TTL_SECONDS")
+        project = _load_or_fetch_project(
+            neon_api,
+            project_id,
+            DEFAULT_CACHE_TTL_SECONDS if cache_ttl is None else cache_ttl,
+            Path(runner_temp) / "neon_cache",
+        )
     plan_value = project.owner.subscription_type.value.lower()
-    if plan_value not in PLAN_CATALOG:
+    prices = PLAN_TUPLES.get(plan_value)
+    if prices is None:
         raise ValueError(
             f"Invalid plan: {plan_value}, expected one of {list(PLAN_CATALOG.keys())}"
         )
-    plan = cast(PlanName, plan_value)
 
     usage = _compute_usage(project)
-    costs = _compute_costs(plan, usage)
-    triggers = _evaluate_alerts(alert_mode_value, thresholds, usage, costs)
-    lowered = webhook_url.lower()
-    if "slack" in lowered:
-        provider: WebHookProvider = "slack"
-    elif "discord" in lowered:
-        provider = "discord"
-    else:
-        raise ValueError(f"Unsupported webhook URL: {webhook_url}")
+    # costs are only needed up front for the spend threshold
+    costs = (
+        _compute_costs(prices, usage) if thresholds.max_spend_usd is not None else None
+    )
+    triggers = _evaluate_alerts(
+        alert_mode,
+        thresholds,
+        usage,
+        None if costs is None else costs.total,
+    )
+    provider = _detect_provider(webhook_url)
     logger.info(
         "Usage - compute CU-h: %.2f, storage GB-m: %.2f, egress GB: %.2f",
         usage.compute_cu_hours,
         usage.storage_gb_month,
         usage.egress_gb,
     )
+
+    if not triggers:
+        logger.info("No alert: thresholds not met.")
+        return
+
+    if costs is None:
+        costs = _compute_costs(prices, usage)
     logger.info(
         "Costs - compute: $%.2f, storage: $%.2f, egress: $%.2f",
         costs.compute_cost,
@@ -252,12 +446,15 @@ def main() -> None:
         costs.egress_cost,
     )
 
-    if not triggers:
-        logger.info("No alert: thresholds not met.")
-        return
-
     message = _render_markdown(provider, usage, costs, triggers, project_id)
-    _send_webhook(webhook_url, provider, message)
+    # an all-blank secret means unset; otherwise sign with the value as given
+    webhook_secret = env.get("WEBHOOK_SECRET", "")
+    _send_webhook(
+        webhook_url,
+        provider,
+        message,
+        webhook_secret.encode("utf-8") if webhook_secret.strip() else None,
+    )
 
 
 if __name__ == "__main__":
@@ -1,12 +1,23 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+from enum import IntEnum
 from typing import Literal
 
 PlanName = Literal["scale", "launch"]
-AlertMode = Literal["always", "thresholds"]
-WebHookProvider = Literal["slack", "discord"]
+# (compute, storage, egress, free_compute, free_storage, free_egress)
+PlanPrices = tuple[float, float, float, float, float, float]
 
 
-@dataclass(frozen=True)
+class AlertMode(IntEnum):
+    ALWAYS = 0
+    THRESHOLDS = 1
+
+
+class WebHookProvider(IntEnum):
+    SLACK = 0
+    DISCORD = 1
+
+
+@dataclass(frozen=True, slots=True)
 class UsagePricing:
     storage_gb_month: float
     compute_cu_hour: float
@@ -16,26 +27,46 @@ class UsagePricing:
     free_egress_gb: float
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class UsageTotals:
     compute_cu_hours: float
     storage_gb_month: float
     egress_gb: float
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class CostBreakdown:
     compute_cost: float
     storage_cost: float
     egress_cost: float
+    total: float = field(init=False)
 
+    def __post_init__(self) -> None:
+        # derived from the fields above so it can never contradict them
+        object.__setattr__(
+            self,
+            "total",
+            self.compute_cost + self.storage_cost + self.egress_cost,
+        )
 
-@dataclass(frozen=True)
+
+@dataclass(frozen=True, slots=True)
 class AlertThresholds:
     max_spend_usd: float | None
     max_cu_usage: float | None
     max_storage_gb_month: float | None
     max_egress_gb: float | None
+    any_set: bool = field(init=False)
+
+    def __post_init__(self) -> None:
+        object.__setattr__(
+            self,
+            "any_set",
+            self.max_spend_usd is not None
+            or self.max_cu_usage is not None
+            or self.max_storage_gb_month is not None
+            or self.max_egress_gb is not None,
+        )
 
 
 PLAN_CATALOG: dict[PlanName, UsagePricing] = {
@@ -56,3 +87,18 @@ PLAN_CATALOG: dict[PlanName, UsagePricing] = {
         free_egress_gb=100.0,
     ),
 }
+
+# Flattened PlanPrices per plan, so cost computation unpacks locals instead of
+# attributes. Keyed by plain str so a raw plan name can be validated and priced
+# with a single lookup.
+PLAN_TUPLES: dict[str, PlanPrices] = {
+    name: (
+        pricing.compute_cu_hour,
+        pricing.storage_gb_month,
+        pricing.egress_gb,
+        pricing.free_compute_cu_hour,
+        pricing.free_storage_gb_month,
+        pricing.free_egress_gb,
+    )
+    for name, pricing in PLAN_CATALOG.items()
+}
@@ -0,0 +1,369 @@
+import hashlib
+import hmac
+import json
+import logging
+from types import SimpleNamespace
+
+import pytest
+from neon_api.schema import BillingSubscriptionType, Project, ProjectOwnerData
+
+import main
+from models import (
+    AlertMode,
+    AlertThresholds,
+    CostBreakdown,
+    UsageTotals,
+    WebHookProvider,
+)
+
+
+def _project(
+    project_id: str = "word-word-12345678",
+    subscription_type: BillingSubscriptionType = BillingSubscriptionType.scale,
+) -> Project:
+    return Project(
+        data_storage_bytes_hour=10 * 1024**3 * 730,
+        data_transfer_bytes=150 * 1024**3,
+        written_data_bytes=0,
+        compute_time_seconds=36_000,
+        active_time_seconds=36_000,
+        cpu_used_sec=0,
+        id=project_id,
+        platform_id="aws",
+        region_id="aws-us-east-2",
+        name="demo",
+        provisioner="k8s-neonvm",
+        pg_version=17,
+        proxy_host="us-east-2.aws.neon.tech",
+        branch_logical_size_limit=0,
+        branch_logical_size_limit_bytes=0,
+        store_passwords=True,
+        creation_source="console",
+        history_retention_seconds=86_400,
+        created_at="2026-01-01T00:00:00Z",
+        updated_at="2026-01-01T00:00:00Z",
+        consumption_period_start="2026-01-01T00:00:00Z",
+        consumption_period_end="2026-02-01T00:00:00Z",
+        owner_id="owner",
+        owner=ProjectOwnerData(
+            email="owner@example.com",
+            name="Owner",
+            branches_limit=10,
+            subscription_type=subscription_type,
+        ),
+    )
+
+
+class _FakeNeonAPI:
+    def __init__(self, project: Project) -> None:
+        self._project = project
+        self.calls = 0
+
+    def project(self, project_id: str) -> SimpleNamespace:
+        self.calls += 1
+        return SimpleNamespace(project=self._project)
+
+
+@pytest.fixture
+def sent_posts(monkeypatch):
+    posts: list[dict] = []
+
+    def fake_post(url, **kwargs):
+        posts.append(kwargs)
+        return SimpleNamespace(status_code=204)
+
+    monkeypatch.setattr(main._SESSION, "post", fake_post)
+    return posts
+
+
+@pytest.fixture
+def action_env(monkeypatch, tmp_path):
+    for name, value in {
+        "GITHUB_ACTIONS": "true",
+        "RUNNER_TEMP": str(tmp_path),
+        "NEON_API_KEY": "napi_test",
+        "NEON_PROJECT_ID": "word-word-12345678",
+        "WEBHOOK_URL": "https://hooks.slack.com/services/T/B/X",
+        "ALERT_MODE": "always",
+    }.items():
+        monkeypatch.setenv(name, value)
+    for name in (
+        "NEON_CACHE_DISABLE",
+        "NEON_CACHE_TTL_SECONDS",
+        "WEBHOOK_SECRET",
+        "MAX_SPEND_USD",
+        "MAX_CU_USAGE",
+        "MAX_STORAGE_GB_MONTH",
+        "MAX_EGRESS_GB",
+    ):
+        monkeypatch.delenv(name, raising=False)
+
+
+def test_project_cache_round_trip(tmp_path):
+    project = _project()
+    neon_api = _FakeNeonAPI(project)
+
+    fetched = main._load_or_fetch_project(neon_api, project.id, 300.0, tmp_path)
+    cached = main._load_or_fetch_project(neon_api, project.id, 300.0, tmp_path)
+
+    assert neon_api.calls == 1
+    assert fetched == project
+    assert cached == project
+    assert (tmp_path / f"{project.id}.json").is_file()
+
+
+def test_project_cache_expired_refetches(tmp_path):
+    project = _project()
+    neon_api = _FakeNeonAPI(project)
+
+    main._load_or_fetch_project(neon_api, project.id, 300.0, tmp_path)
+    main._load_or_fetch_project(neon_api, project.id, 0.0, tmp_path)
+
+    assert neon_api.calls == 2
+
+
+def test_project_cache_rejects_path_separator(tmp_path):
+    neon_api = _FakeNeonAPI(_project())
+
+    with pytest.raises(ValueError, match="Invalid project ID"):
+        main._load_or_fetch_project(neon_api, "../evil", 300.0, tmp_path)
+    assert neon_api.calls == 0
+
+
+def test_main_sends_alert_with_cache_enabled(monkeypatch, action_env, sent_posts):
+    neon_api = _FakeNeonAPI(_project())
+    monkeypatch.setattr(main, "NeonAPI", lambda api_key: neon_api)
+
+    main.main()
+    main.main()
+
+    assert neon_api.calls == 1
+    assert len(sent_posts) == 2
+    assert "Neon billing alert" in json.loads(sent_posts[0]["data"])["text"]
+
+
+def test_main_skips_cache_without_runner_temp(monkeypatch, action_env, sent_posts):
+    monkeypatch.delenv("RUNNER_TEMP")
+    neon_api = _FakeNeonAPI(_project())
+    monkeypatch.setattr(main, "NeonAPI", lambda api_key: neon_api)
+
+    main.main()
+    main.main()
+
+    assert neon_api.calls == 2
+
+
+def test_main_signs_webhook_with_raw_secret(monkeypatch, action_env, sent_posts):
+    # surrounding whitespace is part of the secret, not trimmed
+    secret = " s3cret "
+    monkeypatch.setenv("WEBHOOK_SECRET", secret)
+    monkeypatch.setattr(main, "NeonAPI", lambda api_key: _FakeNeonAPI(_project()))
+
+    main.main()
+
+    body = sent_posts[0]["data"]
+    expected = hmac.new(secret.encode("utf-8"), body, hashlib.sha256).hexdigest()
+    assert sent_posts[0]["headers"]["X-Webhook-Signature"] == f"sha256={expected}"
+
+
+@pytest.mark.parametrize("secret", ["", "   "])
+def test_main_omits_signature_without_secret(
+    monkeypatch, action_env, sent_posts, secret
+):
+    monkeypatch.setenv("WEBHOOK_SECRET", secret)
+    monkeypatch.setattr(main, "NeonAPI", lambda api_key: _FakeNeonAPI(_project()))
+
+    main.main()
+
+    assert "X-Webhook-Signature" not in sent_posts[0]["headers"]
+
+
+def test_send_webhook_batch_signs_every_payload(sent_posts):
+    main._send_webhook_batch(
+        "https://example", WebHookProvider.DISCORD, ["m"] * 11, b"key"
+    )
+
+    assert len(sent_posts) == 2
+    for post in sent_posts:
+        expected = hmac.new(b"key", post["data"], hashlib.sha256).hexdigest()
+        assert post["headers"]["X-Webhook-Signature"] == f"sha256={expected}"
+
+
+@pytest.mark.parametrize(
+    ("webhook_url", "provider"),
+    [
+        ("https://hooks.slack.com/services/T/B/X", WebHookProvider.SLACK),
+        ("https://HOOKS.SLACK.COM/services/T/B/X", WebHookProvider.SLACK),
+        ("https://discord.com/api/webhooks/1/abc", WebHookProvider.DISCORD),
+        ("https://discordapp.com/api/webhooks/1/abc", WebHookProvider.DISCORD),
+        ("https://canary.discord.com/api/webhooks/1/abc", WebHookProvider.DISCORD),
+    ],
+)
+def test_detect_provider(webhook_url, provider):
+    assert main._detect_provider(webhook_url) == provider
+
+
+@pytest.mark.parametrize(
+    "webhook_url",
+    [
+        "https://hooks.slack.com.evil.com/services/T/B/X",
+        "https://www.discord.com/api/webhooks/1/abc",
+        "https://proxy.example.com/slack/discord",
+        "not a url",
+    ],
+)
+def test_detect_provider_rejects_other_hosts(webhook_url):
+    with pytest.raises(ValueError, match="Unsupported webhook URL"):
+        main._detect_provider(webhook_url)
+
+
+def _sent_payloads(sent_posts: list[dict]) -> list[dict]:
+    return [json.loads(post["data"]) for post in sent_posts]
+
+
+@pytest.mark.parametrize(
+    ("provider", "count", "sizes"),
+    [
+        (WebHookProvider.SLACK, 50, [50]),
+        (WebHookProvider.SLACK, 51, [50, 1]),
+        (WebHookProvider.DISCORD, 10, [10]),
+        (WebHookProvider.DISCORD, 11, [10, 1]),
+    ],
+)
+def test_send_webhook_batch_chunks(sent_posts, provider, count, sizes):
+    main._send_webhook_batch("https://example", provider, ["m"] * count)
+
+    key = "blocks" if provider is WebHookProvider.SLACK else "embeds"
+    assert [len(payload[key]) for payload in _sent_payloads(sent_posts)] == sizes
+
+
+def test_send_webhook_batch_payload_shape(sent_posts):
+    main._send_webhook_batch("https://example", WebHookProvider.SLACK, ["a"])
+    main._send_webhook_batch("https://example", WebHookProvider.DISCORD, ["b"])
+
+    assert _sent_payloads(sent_posts) == [
+        {"blocks": [{"type": "section", "text": {"type": "mrkdwn", "text": "a"}}]},
+        {"embeds": [{"description": "b"}]},
+    ]
+
+
+@pytest.mark.parametrize(
+    ("provider", "limit"),
+    [(WebHookProvider.SLACK, 3000), (WebHookProvider.DISCORD, 4096)],
+)
+def test_send_webhook_batch_truncates_long_items(sent_posts, provider, limit):
+    main._send_webhook_batch("https://example", provider, ["x" * (limit + 500)])
+
+    payload = _sent_payloads(sent_posts)[0]
+    if provider is WebHookProvider.SLACK:
+        text = payload["blocks"][0]["text"]["text"]
+    else:
+        text = payload["embeds"][0]["description"]
+    assert len(text) == limit
+    assert text.endswith("…")
+
+
+def test_send_webhook_batch_keeps_discord_payloads_under_6000_chars(sent_posts):
+    main._send_webhook_batch(
+        "https://example", WebHookProvider.DISCORD, ["x" * 5000] * 3
+    )
+
+    payloads = _sent_payloads(sent_posts)
+    totals = [
+        sum(len(embed["description"]) for embed in payload["embeds"])
+        for payload in payloads
+    ]
+    assert len(payloads) == 3
+    assert all(total <= 6000 for total in totals)
+
+
+def test_send_webhook_batch_packs_discord_items_by_budget(sent_posts):
+    main._send_webhook_batch(
+        "https://example", WebHookProvider.DISCORD, ["x" * 2000] * 4
+    )
+
+    payloads = _sent_payloads(sent_posts)
+    assert [len(payload["embeds"]) for payload in payloads] == [3, 1]
+
+
+def test_evaluate_alerts_spend_threshold():
+    thresholds = AlertThresholds(10.0, None, None, None)
+    usage = UsageTotals(0.0, 0.0, 0.0)
+
+    assert main._evaluate_alerts(AlertMode.THRESHOLDS, thresholds, usage, 12.0) == [
+        "total_cost>=10.0"
+    ]
+    assert main._evaluate_alerts(AlertMode.THRESHOLDS, thresholds, usage, 5.0) == []
+
+
+def test_evaluate_alerts_requires_total_for_spend_threshold():
+    thresholds = AlertThresholds(10.0, None, None, None)
+
+    with pytest.raises(ValueError, match="requires the total cost"):
+        main._evaluate_alerts(
+            AlertMode.THRESHOLDS, thresholds, UsageTotals(0, 0, 0), None
+        )
+
+
+def test_main_spend_threshold(monkeypatch, action_env, sent_posts):
+    monkeypatch.setenv("ALERT_MODE", "thresholds")
+    monkeypatch.setenv("MAX_SPEND_USD", "1")
+    monkeypatch.setattr(main, "NeonAPI", lambda api_key: _FakeNeonAPI(_project()))
+
+    main.main()
+
+    message = json.loads(sent_posts[0]["data"])["text"]
+    assert "Trigger: total_cost>=1.0" in message
+
+
+def test_main_rejects_unpriced_plan(monkeypatch, action_env, sent_posts):
+    project = _project(subscription_type=BillingSubscriptionType.business)
+    monkeypatch.setattr(main, "NeonAPI", lambda api_key: _FakeNeonAPI(project))
+
+    with pytest.raises(ValueError, match="Invalid plan: business"):
+        main.main()
+    assert sent_posts == []
+
+
+@pytest.mark.parametrize(
+    ("raw_value", "expected"),
+    [
+        (None, logging.INFO),
+        ("", logging.INFO),
+        (" debug ", logging.DEBUG),
+        ("WARNING", logging.WARNING),
+        ("verbose", logging.INFO),
+        ("10", logging.INFO),
+    ],
+)
+def test_resolve_log_level(raw_value, expected):
+    assert main._resolve_log_level(raw_value) == expected
+
+
+def test_cost_breakdown_total_is_derived():
+    assert CostBreakdown(1.0, 2.0, 3.0).total == 6.0
+    with pytest.raises(TypeError):
+        CostBreakdown(1.0, 2.0, 3.0, total=99.0)
+
+
+def test_parse_thresholds():
+    thresholds = main._parse_thresholds(
+        {"MAX_SPEND_USD": " 12.5 ", "MAX_CU_USAGE": "", "MAX_EGRESS_GB": "3"}
+    )
+
+    assert thresholds.max_spend_usd == 12.5
+    assert thresholds.max_cu_usage is None
+    assert thresholds.max_storage_gb_month is None
+    assert thresholds.max_egress_gb == 3.0
+
+
+def test_parse_thresholds_rejects_non_numbers():
+    with pytest.raises(ValueError, match="MAX_CU_USAGE must be a number"):
+        main._parse_thresholds({"MAX_CU_USAGE": "lots"})
+
+
+def test_alert_thresholds_any_set_is_derived():
+    assert not AlertThresholds(None, None, None, None).any_set
+    assert AlertThresholds(None, 0.0, None, None).any_set
+    with pytest.raises(TypeError):
+        AlertThresholds(None, None, None, None, any_set=True)